@@ -18,11 +18,12 @@ import string
 import random
 import json
 import yaml
+import copy
 import re
 
 import boto3
 import botocore
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, WaiterError
 from sagemaker.amazon.amazon_estimator import get_image_uri
 
 import logging
@@ -50,6 +51,19 @@ built_in_algos = {
     'seq2seq modeling': 'seq2seq',
     'xgboost': 'xgboost'
 }
+built_in_algo_image_names = frozenset(built_in_algos.values())
+
+# Resolved built-in algorithm image URIs, keyed by region and algorithm image name
+_built_in_algorithm_images = {}
+
+# Clients to the SageMaker API, keyed by region and endpoint URL
+_sagemaker_clients = {}
+
+# Cache of DescribeTrainingJob responses for jobs in a terminal state, keyed by job name
+_terminal_training_job_descriptions = {}
+
+# Parsed request templates, keyed by template name
+_request_templates = {}
 
 # Get current directory to open templates
 __cwd__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -81,95 +95,126 @@ def get_component_version():
 
 
 def get_sagemaker_client(region, endpoint_url=None):
-    """Builds a client to the AWS SageMaker API."""
-    session_config = botocore.config.Config(
-        user_agent='sagemaker-on-kubeflow-pipelines-v{}'.format(get_component_version())
-    )
-    client = boto3.client('sagemaker', region_name=region, endpoint_url=endpoint_url, config=session_config)
-    return client
+    """Builds a client to the AWS SageMaker API, shared by all callers in the same region and endpoint.
+
+    Every SageMaker call made with the client retries throttled requests using botocore's adaptive
+    retry mode, which rate limits the client side instead of failing on "Rate exceeded" errors.
+    """
+    client_key = (region, endpoint_url)
+    if client_key not in _sagemaker_clients:
+        session_config = botocore.config.Config(
+            user_agent='sagemaker-on-kubeflow-pipelines-v{}'.format(get_component_version()),
+            retries={'max_attempts': 10, 'mode': 'adaptive'},
+            max_pool_connections=50,
+            connect_timeout=5,
+            read_timeout=60
+        )
+        _sagemaker_clients[client_key] = boto3.client('sagemaker', region_name=region, endpoint_url=endpoint_url, config=session_config)
+    return _sagemaker_clients[client_key]
+
+
+def get_request_template(template_name):
+    """Get a copy of a request template, parsing the template file only the first time it is requested."""
+    if template_name not in _request_templates:
+        with open(os.path.join(__cwd__, template_name + '.template.yaml'), 'r') as f:
+            _request_templates[template_name] = yaml.safe_load(f)
+    return copy.deepcopy(_request_templates[template_name])
+
+
+def get_built_in_algorithm_image(region, algorithm_name):
+    """Get the image URI of a built-in algorithm, or None if the name is not a built-in algorithm."""
+    algo_name = algorithm_name.lower().strip()
+    # Accept the image names as well, to give the user more leeway for built-in algorithm name inputs
+    image_name = built_in_algos.get(algo_name, algo_name if algo_name in built_in_algo_image_names else None)
+    if image_name is None:
+        return None
+
+    image_key = (region, image_name)
+    if image_key not in _built_in_algorithm_images:
+        _built_in_algorithm_images[image_key] = get_image_uri(region, image_name)
+    return _built_in_algorithm_images[image_key]
 
 
 def create_training_job_request(args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_training_job
-    with open(os.path.join(__cwd__, 'train.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('train')
 
     job_name = args['job_name'] if args['job_name'] else 'TrainingJob-' + strftime("%Y%m%d%H%M%S", gmtime()) + '-' + id_generator()
 
-    request['TrainingJobName'] = job_name
-    request['RoleArn'] = args['role']
-    request['HyperParameters'] = args['hyperparameters']
-    request['AlgorithmSpecification']['TrainingInputMode'] = args['training_input_mode']
+    request.update({
+        'TrainingJobName': job_name,
+        'RoleArn': args['role'],
+        'HyperParameters': args['hyperparameters'],
+        'EnableNetworkIsolation': args['network_isolation'],
+        'EnableInterContainerTrafficEncryption': args['traffic_encryption']
+    })
 
     ### Update training image (for BYOC and built-in algorithms) or algorithm resource name
-    if not args['image'] and not args['algorithm_name']:
+    image = args['image']
+    algorithm_name = args['algorithm_name']
+    if not image and not algorithm_name:
         logging.error('Please specify training image or algorithm name.')
         raise Exception('Could not create job request')
-    if args['image'] and args['algorithm_name']:
+    if image and algorithm_name:
         logging.error('Both image and algorithm name inputted, only one should be specified. Proceeding with image.')
 
-    if args['image']:
-        request['AlgorithmSpecification']['TrainingImage'] = args['image']
-        request['AlgorithmSpecification'].pop('AlgorithmName')
+    algorithm_specification = {'TrainingInputMode': args['training_input_mode']}
+    if image:
+        algorithm_specification['TrainingImage'] = image
     else:
         # TODO: Adjust this implementation to account for custom algorithm resources names that are the same as built-in algorithm names
-        algo_name = args['algorithm_name'].lower().strip()
-        if algo_name in built_in_algos.keys():
-            request['AlgorithmSpecification']['TrainingImage'] = get_image_uri(args['region'], built_in_algos[algo_name])
-            request['AlgorithmSpecification'].pop('AlgorithmName')
-            logging.warning('Algorithm name is found as an Amazon built-in algorithm. Using built-in algorithm.')
-        # Just to give the user more leeway for built-in algorithm name inputs
-        elif algo_name in built_in_algos.values():
-            request['AlgorithmSpecification']['TrainingImage'] = get_image_uri(args['region'], algo_name)
-            request['AlgorithmSpecification'].pop('AlgorithmName')
+        built_in_image = get_built_in_algorithm_image(args['region'], algorithm_name)
+        if built_in_image:
+            algorithm_specification['TrainingImage'] = built_in_image
             logging.warning('Algorithm name is found as an Amazon built-in algorithm. Using built-in algorithm.')
         else:
-            request['AlgorithmSpecification']['AlgorithmName'] = args['algorithm_name']
-            request['AlgorithmSpecification'].pop('TrainingImage')
-    
+            algorithm_specification['AlgorithmName'] = algorithm_name
+
     ### Update metric definitions
-    if args['metric_definitions']:
-        for key, val in args['metric_definitions'].items():
-            request['AlgorithmSpecification']['MetricDefinitions'].append({'Name': key, 'Regex': val})
-    else:
-        request['AlgorithmSpecification'].pop('MetricDefinitions')
+    metric_definitions = args['metric_definitions']
+    if metric_definitions:
+        algorithm_specification['MetricDefinitions'] = [{'Name': key, 'Regex': val} for key, val in metric_definitions.items()]
+
+    request['AlgorithmSpecification'] = algorithm_specification
 
     ### Update or pop VPC configs
-    if args['vpc_security_group_ids'] and args['vpc_subnets']:
-        request['VpcConfig']['SecurityGroupIds'] = [args['vpc_security_group_ids']]
-        request['VpcConfig']['Subnets'] = [args['vpc_subnets']]
+    security_group_ids = args['vpc_security_group_ids']
+    subnets = args['vpc_subnets']
+    if security_group_ids and subnets:
+        request['VpcConfig']['SecurityGroupIds'] = [n.strip() for n in security_group_ids.split(',')]
+        request['VpcConfig']['Subnets'] = [n.strip() for n in subnets.split(',')]
     else:
         request.pop('VpcConfig')
 
     ### Update input channels, must have at least one specified
-    if len(args['channels']) > 0:
-        request['InputDataConfig'] = args['channels']
-    else:
+    channels = args['channels']
+    if not channels:
         logging.error("Must specify at least one input channel.")
         raise Exception('Could not create job request')
+    request['InputDataConfig'] = channels
 
-    request['OutputDataConfig']['S3OutputPath'] = args['model_artifact_path']
-    request['OutputDataConfig']['KmsKeyId'] = args['output_encryption_key']
-    request['ResourceConfig']['InstanceType'] = args['instance_type']
-    request['ResourceConfig']['VolumeKmsKeyId'] = args['resource_encryption_key']
-    request['EnableNetworkIsolation'] = args['network_isolation']
-    request['EnableInterContainerTrafficEncryption'] = args['traffic_encryption']
+    request['OutputDataConfig'].update({
+        'S3OutputPath': args['model_artifact_path'],
+        'KmsKeyId': args['output_encryption_key']
+    })
 
-    ### Update InstanceCount, VolumeSizeInGB, and MaxRuntimeInSeconds if input is non-empty and > 0, otherwise use default values
-    if args['instance_count']:
-        request['ResourceConfig']['InstanceCount'] = args['instance_count']
+    request['ResourceConfig'].update({
+        'InstanceType': args['instance_type'],
+        'VolumeKmsKeyId': args['resource_encryption_key']
+    })
 
-    if args['volume_size']:
-        request['ResourceConfig']['VolumeSizeInGB'] = args['volume_size']
+    ### Update InstanceCount, VolumeSizeInGB, and MaxRuntimeInSeconds if input is non-empty and > 0, otherwise use default values
+    optional_resource_config = {'InstanceCount': args['instance_count'], 'VolumeSizeInGB': args['volume_size']}
+    request['ResourceConfig'].update({key: value for key, value in optional_resource_config.items() if value})
 
-    if args['max_run_time']:
-        request['StoppingCondition']['MaxRuntimeInSeconds'] = args['max_run_time']
+    max_run_time = args['max_run_time']
+    if max_run_time:
+        request['StoppingCondition']['MaxRuntimeInSeconds'] = max_run_time
 
     enable_spot_instance_support(request, args)
 
     ### Update tags
-    for key, val in args['tags'].items():
-        request['Tags'].append({'Key': key, 'Value': val})
+    request['Tags'] = [{'Key': key, 'Value': val} for key, val in args['tags'].items()]
 
     return request
 
@@ -180,39 +225,62 @@ def create_training_job(client, args):
   try:
       client.create_training_job(**request)
       training_job_name = request['TrainingJobName']
-      logging.info("Created Training Job with name: " + training_job_name)
-      logging.info("Training job in SageMaker: https://{}.console.aws.amazon.com/sagemaker/home?region={}#/jobs/{}"
-        .format(args['region'], args['region'], training_job_name))
-      logging.info("CloudWatch logs: https://{}.console.aws.amazon.com/cloudwatch/home?region={}#logStream:group=/aws/sagemaker/TrainingJobs;prefix={};streamFilter=typeLogStreamPrefix"
-        .format(args['region'], args['region'], training_job_name))
+      region = args['region']
+      logging.info("Created Training Job with name: %s", training_job_name)
+      logging.info("Training job in SageMaker: https://%s.console.aws.amazon.com/sagemaker/home?region=%s#/jobs/%s",
+        region, region, training_job_name)
+      logging.info("CloudWatch logs: https://%s.console.aws.amazon.com/cloudwatch/home?region=%s#logStream:group=/aws/sagemaker/TrainingJobs;prefix=%s;streamFilter=typeLogStreamPrefix",
+        region, region, training_job_name)
       return training_job_name
   except ClientError as e:
       raise Exception(e.response['Error']['Message'])
 
 
-def wait_for_training_job(client, training_job_name):
+def wait_for_training_job(client, training_job_name, poll_interval=30, poll_attempts=20):
+  ### Let the boto3 waiter poll until the job completes, fails or is stopped,
+  ### logging the current status each time a batch of poll attempts runs out
+  waiter = client.get_waiter('training_job_completed_or_stopped')
   while(True):
-    response = client.describe_training_job(TrainingJobName=training_job_name)
-    status = response['TrainingJobStatus']
-    if status == 'Completed':
-      logging.info("Training job ended with status: " + status)
+    try:
+      waiter.wait(TrainingJobName=training_job_name, WaiterConfig={'Delay': poll_interval, 'MaxAttempts': poll_attempts})
       break
-    if status == 'Failed':
-      message = response['FailureReason']
-      logging.info('Training failed with the following error: {}'.format(message))
-      raise Exception('Training job failed')
-    logging.info("Training job is still in status: " + status)
-    time.sleep(30)
+    except WaiterError as e:
+      status = e.last_response.get('TrainingJobStatus')
+      if status not in ('InProgress', 'Stopping'):
+        break
+      logging.info("Training job is still in status: " + status)
+
+  response = describe_training_job(client, training_job_name)
+  status = response['TrainingJobStatus']
+  if status == 'Completed':
+    logging.info("Training job ended with status: " + status)
+    return
+  if status == 'Failed':
+    message = response['FailureReason']
+    logging.info('Training failed with the following error: {}'.format(message))
+    raise Exception('Training job failed')
+  raise Exception('Training job ended with status: ' + status)
+
+
+def describe_training_job(client, job_name):
+  """Describe a training job, reusing the response once the job has reached a terminal state."""
+  if job_name in _terminal_training_job_descriptions:
+    return _terminal_training_job_descriptions[job_name]
+
+  info = client.describe_training_job(TrainingJobName=job_name)
+  if info['TrainingJobStatus'] in ('Completed', 'Failed', 'Stopped'):
+    _terminal_training_job_descriptions[job_name] = info
+  return info
 
 
 def get_model_artifacts_from_job(client, job_name):
-  info = client.describe_training_job(TrainingJobName=job_name)
+  info = describe_training_job(client, job_name)
   model_artifact_url = info['ModelArtifacts']['S3ModelArtifacts']
   return model_artifact_url
 
 
 def get_image_from_job(client, job_name):
-    info = client.describe_training_job(TrainingJobName=job_name)
+    info = describe_training_job(client, job_name)
     try:
         image = info['AlgorithmSpecification']['TrainingImage']
     except:
@@ -222,10 +290,25 @@ def get_image_from_job(client, job_name):
     return image
 
 
+def get_training_job_outputs(client, job_name):
+  """Get the model artifact URL and training image of a finished training job."""
+  return get_model_artifacts_from_job(client, job_name), get_image_from_job(client, job_name)
+
+
+def run_training_job(client, args):
+  """Create a Sagemaker training job, wait for it to complete and return its name, model artifact URL and training image."""
+  logging.info('Submitting Training Job to SageMaker...')
+  job_name = create_training_job(client, args)
+  logging.info('Job request submitted. Waiting for completion...')
+  wait_for_training_job(client, job_name)
+
+  model_artifact_url, image = get_training_job_outputs(client, job_name)
+  return job_name, model_artifact_url, image
+
+
 def create_model(client, args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_model
-    with open(os.path.join(__cwd__, 'model.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('model')
 
     request['ModelName'] = args['model_name']
     request['PrimaryContainer']['Environment'] = args['environment']
@@ -285,8 +368,7 @@ def deploy_model(client, args):
 
 def create_endpoint_config(client, args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_endpoint_config
-    with open(os.path.join(__cwd__, 'endpoint_config.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('endpoint_config')
 
     endpoint_config_name = args['endpoint_config_name'] if args['endpoint_config_name'] else 'EndpointConfig' + args['model_name_1'][args['model_name_1'].index('-'):]
     request['EndpointConfigName'] = endpoint_config_name
@@ -376,8 +458,7 @@ def wait_for_endpoint_creation(client, endpoint_name):
 
 def create_transform_job_request(args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_transform_job
-    with open(os.path.join(__cwd__, 'transform.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('transform')
 
     job_name = args['job_name'] if args['job_name'] else 'BatchTransform' + args['model_name'][args['model_name'].index('-'):]
 
@@ -468,8 +549,7 @@ def wait_for_transform_job(client, batch_job_name):
 
 def create_hyperparameter_tuning_job_request(args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_hyper_parameter_tuning_job
-    with open(os.path.join(__cwd__, 'hpo.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('hpo')
 
     ### Create a hyperparameter tuning job
     request['HyperParameterTuningJobName'] = args['job_name'] if args['job_name'] else "HPOJob-" + strftime("%Y%m%d%H%M%S", gmtime()) + '-' + id_generator()
@@ -499,14 +579,9 @@ def create_hyperparameter_tuning_job_request(args):
         request['TrainingJobDefinition']['AlgorithmSpecification'].pop('AlgorithmName')
     else:
         # TODO: Adjust this implementation to account for custom algorithm resources names that are the same as built-in algorithm names
-        algo_name = args['algorithm_name'].lower().strip()
-        if algo_name in built_in_algos.keys():
-            request['TrainingJobDefinition']['AlgorithmSpecification']['TrainingImage'] = get_image_uri(args['region'], built_in_algos[algo_name])
-            request['TrainingJobDefinition']['AlgorithmSpecification'].pop('AlgorithmName')
-            logging.warning('Algorithm name is found as an Amazon built-in algorithm. Using built-in algorithm.')
-        # To give the user more leeway for built-in algorithm name inputs
-        elif algo_name in built_in_algos.values():
-            request['TrainingJobDefinition']['AlgorithmSpecification']['TrainingImage'] = get_image_uri(args['region'], algo_name)
+        built_in_image = get_built_in_algorithm_image(args['region'], args['algorithm_name'])
+        if built_in_image:
+            request['TrainingJobDefinition']['AlgorithmSpecification']['TrainingImage'] = built_in_image
             request['TrainingJobDefinition']['AlgorithmSpecification'].pop('AlgorithmName')
             logging.warning('Algorithm name is found as an Amazon built-in algorithm. Using built-in algorithm.')
         else:
@@ -621,8 +696,7 @@ def get_best_training_job_and_hyperparameters(client, hpo_job_name):
 def create_workteam(client, args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_workteam
     """Create a workteam"""
-    with open(os.path.join(__cwd__, 'workteam.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('workteam')
 
     request['WorkteamName'] = args['team_name']
     request['Description'] = args['description']
@@ -649,8 +723,7 @@ def create_workteam(client, args):
 
 def create_labeling_job_request(args):
     ### Documentation: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_labeling_job
-    with open(os.path.join(__cwd__, 'gt.template.yaml'), 'r') as f:
-        request = yaml.safe_load(f)
+    request = get_request_template('gt')
 
     # Mapping are extracted from ARNs listed in https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sagemaker.html#SageMaker.Client.create_labeling_job
     algorithm_arn_map = {'us-west-2': '081040173940',
@@ -2,7 +2,7 @@ import json
 import unittest
 
 from unittest.mock import patch, Mock, MagicMock
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, WaiterError
 from datetime import datetime
 
 from train.src import train
@@ -26,6 +26,14 @@ class TrainTestCase(unittest.TestCase):
     parser = train.create_parser()
     cls.parser = parser
 
+  def setUp(self):
+    # Start each test with empty module caches and restore them afterwards
+    for cache in [_utils._terminal_training_job_descriptions, _utils._sagemaker_clients,
+                  _utils._built_in_algorithm_images, _utils._request_templates]:
+      cache_patcher = patch.dict(cache, clear=True)
+      cache_patcher.start()
+      self.addCleanup(cache_patcher.stop)
+
   def test_spot_bad_args(self):
     no_max_wait_args = self.parser.parse_args(required_args + ['--spot_instance', 'True'])
     no_checkpoint_args = self.parser.parse_args(required_args + ['--spot_instance', 'True', '--max_wait_time', '3600'])
@@ -51,4 +59,205 @@ class TrainTestCase(unittest.TestCase):
     args = self.parser.parse_args(required_args + ['--spot_instance', 'True', '--max_wait_time', '3600', '--checkpoint_config', '{"S3Uri": "s3://fake-uri/", "LocalPath": "local-path"}'])
     response = _utils.create_training_job_request(vars(args))
     self.assertEqual(response['CheckpointConfig']['S3Uri'], 's3://fake-uri/')
-    self.assertEqual(response['CheckpointConfig']['LocalPath'], 'local-path')
\ No newline at end of file
+    self.assertEqual(response['CheckpointConfig']['LocalPath'], 'local-path')
+
+  def test_wait_for_training_job_completed(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {'TrainingJobStatus': 'Completed'}
+
+    _utils.wait_for_training_job(mock_client, 'test-job')
+
+    mock_client.get_waiter.assert_called_once_with('training_job_completed_or_stopped')
+    mock_client.get_waiter.return_value.wait.assert_called_once()
+    mock_client.describe_training_job.assert_called_once_with(TrainingJobName='test-job')
+
+  def test_wait_for_training_job_still_in_progress(self):
+    mock_client = MagicMock()
+    mock_client.get_waiter.return_value.wait.side_effect = [
+      WaiterError('TrainingJobCompletedOrStopped', 'Max attempts exceeded', {'TrainingJobStatus': 'InProgress'}),
+      None
+    ]
+    mock_client.describe_training_job.return_value = {'TrainingJobStatus': 'Completed'}
+
+    _utils.wait_for_training_job(mock_client, 'test-job')
+
+    self.assertEqual(mock_client.get_waiter.return_value.wait.call_count, 2)
+    mock_client.describe_training_job.assert_called_once_with(TrainingJobName='test-job')
+
+  def test_wait_for_training_job_failed(self):
+    mock_client = MagicMock()
+    mock_client.get_waiter.return_value.wait.side_effect = WaiterError(
+      'TrainingJobCompletedOrStopped', 'Waiter encountered a terminal failure state', {'TrainingJobStatus': 'Failed'})
+    mock_client.describe_training_job.return_value = {'TrainingJobStatus': 'Failed', 'FailureReason': 'fake-reason'}
+
+    with self.assertRaises(Exception):
+      _utils.wait_for_training_job(mock_client, 'test-job')
+
+  def test_wait_for_training_job_stopped(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {'TrainingJobStatus': 'Stopped'}
+
+    with self.assertRaises(Exception):
+      _utils.wait_for_training_job(mock_client, 'test-job')
+
+  def test_get_outputs_reuse_terminal_description(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {
+      'TrainingJobStatus': 'Completed',
+      'AlgorithmSpecification': {'TrainingImage': 'test-image'},
+      'ModelArtifacts': {'S3ModelArtifacts': 's3://fake-bucket/model.tar.gz'}
+    }
+
+    _utils.wait_for_training_job(mock_client, 'test-job')
+    self.assertEqual(_utils.get_image_from_job(mock_client, 'test-job'), 'test-image')
+    self.assertEqual(_utils.get_model_artifacts_from_job(mock_client, 'test-job'), 's3://fake-bucket/model.tar.gz')
+
+    mock_client.describe_training_job.assert_called_once_with(TrainingJobName='test-job')
+
+  def test_describe_training_job_not_cached_in_progress(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {'TrainingJobStatus': 'InProgress'}
+
+    _utils.describe_training_job(mock_client, 'test-job')
+    _utils.describe_training_job(mock_client, 'test-job')
+
+    self.assertEqual(mock_client.describe_training_job.call_count, 2)
+
+  def test_get_training_job_outputs_algorithm_name(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {
+      'TrainingJobStatus': 'Completed',
+      'AlgorithmSpecification': {'AlgorithmName': 'test-algorithm'},
+      'ModelArtifacts': {'S3ModelArtifacts': 's3://fake-bucket/model.tar.gz'}
+    }
+    mock_client.describe_algorithm.return_value = {'TrainingSpecification': {'TrainingImage': 'test-algorithm-image'}}
+
+    model_artifact_url, image = _utils.get_training_job_outputs(mock_client, 'test-job')
+
+    self.assertEqual(model_artifact_url, 's3://fake-bucket/model.tar.gz')
+    self.assertEqual(image, 'test-algorithm-image')
+    mock_client.describe_training_job.assert_called_once_with(TrainingJobName='test-job')
+    mock_client.describe_algorithm.assert_called_once_with(AlgorithmName='test-algorithm')
+
+  def test_create_training_job_request(self):
+    args = self.parser.parse_args(required_args + ['--job_name', 'test-job', '--output_encryption_key', 'test-key'])
+    response = _utils.create_training_job_request(vars(args))
+
+    self.assertEqual(response['TrainingJobName'], 'test-job')
+    self.assertEqual(response['RoleArn'], 'arn:aws:iam::123456789012:user/Development/product_1234/*')
+    self.assertEqual(response['AlgorithmSpecification'], {'TrainingImage': 'test-image', 'TrainingInputMode': 'File'})
+    self.assertEqual(response['OutputDataConfig'], {'S3OutputPath': 'test-path', 'KmsKeyId': 'test-key'})
+    self.assertEqual(response['ResourceConfig'], {'InstanceType': 'ml.m4.xlarge', 'InstanceCount': 1, 'VolumeSizeInGB': 50, 'VolumeKmsKeyId': ''})
+    self.assertEqual(response['StoppingCondition']['MaxRuntimeInSeconds'], 3600)
+    self.assertTrue(response['EnableNetworkIsolation'])
+    self.assertFalse(response['EnableInterContainerTrafficEncryption'])
+
+  def test_create_training_job_request_default_resources(self):
+    args = self.parser.parse_args(required_args + ['--instance_count', '', '--volume_size', ''])
+    response = _utils.create_training_job_request(vars(args))
+
+    self.assertEqual(response['ResourceConfig']['InstanceCount'], 1)
+    self.assertEqual(response['ResourceConfig']['VolumeSizeInGB'], 1)
+
+  def test_built_in_algorithm_name(self):
+    for algorithm_name in ['K-Means', 'kmeans']:
+      args = self.parser.parse_args(required_args + ['--image', '', '--algorithm_name', algorithm_name])
+      response = _utils.create_training_job_request(vars(args))
+      self.assertIn('kmeans', response['AlgorithmSpecification']['TrainingImage'])
+      self.assertNotIn('AlgorithmName', response['AlgorithmSpecification'])
+
+  def test_custom_algorithm_name(self):
+    args = self.parser.parse_args(required_args + ['--image', '', '--algorithm_name', 'Test-Algorithm'])
+    response = _utils.create_training_job_request(vars(args))
+    self.assertEqual(response['AlgorithmSpecification']['AlgorithmName'], 'Test-Algorithm')
+    self.assertNotIn('TrainingImage', response['AlgorithmSpecification'])
+
+  def test_vpc_config(self):
+    args = self.parser.parse_args(required_args + ['--vpc_security_group_ids', 'sg-1,sg-2', '--vpc_subnets', 'subnet-1, subnet-2'])
+    response = _utils.create_training_job_request(vars(args))
+    self.assertEqual(response['VpcConfig']['SecurityGroupIds'], ['sg-1', 'sg-2'])
+    self.assertEqual(response['VpcConfig']['Subnets'], ['subnet-1', 'subnet-2'])
+
+  def test_no_vpc_config(self):
+    args = self.parser.parse_args(required_args + ['--vpc_security_group_ids', 'sg-1'])
+    response = _utils.create_training_job_request(vars(args))
+    self.assertNotIn('VpcConfig', response)
+
+  def test_metric_definitions_and_tags(self):
+    args = self.parser.parse_args(required_args + ['--metric_definitions', '{"accuracy": "acc=(.*)"}', '--tags', '{"project": "test"}'])
+    response = _utils.create_training_job_request(vars(args))
+    self.assertEqual(response['AlgorithmSpecification']['MetricDefinitions'], [{'Name': 'accuracy', 'Regex': 'acc=(.*)'}])
+    self.assertEqual(response['Tags'], [{'Key': 'project', 'Value': 'test'}])
+
+  def test_no_metric_definitions(self):
+    args = self.parser.parse_args(required_args)
+    response = _utils.create_training_job_request(vars(args))
+    self.assertNotIn('MetricDefinitions', response['AlgorithmSpecification'])
+    self.assertEqual(response['Tags'], [])
+
+  @patch('common._utils.get_component_version', return_value='0.3.0')
+  @patch('common._utils.boto3.client')
+  def test_get_sagemaker_client_shared(self, mock_boto3_client, mock_version):
+    first_client = _utils.get_sagemaker_client('us-west-2')
+    second_client = _utils.get_sagemaker_client('us-west-2')
+    _utils.get_sagemaker_client('us-east-1')
+
+    self.assertIs(first_client, second_client)
+    self.assertEqual(mock_boto3_client.call_count, 2)
+
+    session_config = mock_boto3_client.call_args[1]['config']
+    self.assertEqual(session_config.retries, {'max_attempts': 10, 'mode': 'adaptive'})
+    self.assertEqual(session_config.max_pool_connections, 50)
+
+  @patch('common._utils.get_image_uri', return_value='test-kmeans-image')
+  def test_get_built_in_algorithm_image_cached(self, mock_get_image_uri):
+    self.assertEqual(_utils.get_built_in_algorithm_image('us-west-2', 'K-Means'), 'test-kmeans-image')
+    self.assertEqual(_utils.get_built_in_algorithm_image('us-west-2', 'kmeans'), 'test-kmeans-image')
+    self.assertIsNone(_utils.get_built_in_algorithm_image('us-west-2', 'test-algorithm'))
+
+    mock_get_image_uri.assert_called_once_with('us-west-2', 'kmeans')
+
+  def test_request_template_not_shared(self):
+    args = self.parser.parse_args(required_args)
+    _utils.create_training_job_request(vars(args))
+    response = _utils.create_training_job_request(vars(args))
+
+    self.assertNotIn('CheckpointConfig', response)
+    template = _utils.get_request_template('train')
+    self.assertIn('CheckpointConfig', template)
+    self.assertIn('MaxWaitTimeInSeconds', template['StoppingCondition'])
+
+  def test_create_training_job_logs_console_urls(self):
+    mock_client = MagicMock()
+    args = self.parser.parse_args(required_args + ['--job_name', 'test-job'])
+
+    with self.assertLogs(level='INFO') as logs:
+      job_name = _utils.create_training_job(mock_client, vars(args))
+
+    self.assertEqual(job_name, 'test-job')
+    mock_client.create_training_job.assert_called_once()
+    self.assertIn('INFO:root:Training job in SageMaker: https://us-west-2.console.aws.amazon.com/sagemaker/home?region=us-west-2#/jobs/test-job', logs.output)
+
+  def test_no_channels(self):
+    for channels in [[], None]:
+      args = vars(self.parser.parse_args(required_args))
+      args['channels'] = channels
+      with self.assertRaises(Exception):
+        _utils.create_training_job_request(args)
+
+  def test_run_training_job(self):
+    mock_client = MagicMock()
+    mock_client.describe_training_job.return_value = {
+      'TrainingJobStatus': 'Completed',
+      'AlgorithmSpecification': {'TrainingImage': 'test-image'},
+      'ModelArtifacts': {'S3ModelArtifacts': 's3://fake-bucket/model.tar.gz'}
+    }
+    args = self.parser.parse_args(required_args + ['--job_name', 'test-job'])
+
+    outputs = _utils.run_training_job(mock_client, vars(args))
+
+    self.assertEqual(outputs, ('test-job', 's3://fake-bucket/model.tar.gz', 'test-image'))
+    mock_client.create_training_job.assert_called_once()
+    mock_client.get_waiter.return_value.wait.assert_called_once()
+    mock_client.describe_training_job.assert_called_once_with(TrainingJobName='test-job')
+    mock_client.describe_algorithm.assert_not_called()
@@ -36,8 +36,8 @@ def create_parser():
   parser.add_argument('--max_run_time', type=_utils.str_to_int, required=True, help='The maximum run time in seconds for the training job.', default=86400)
   parser.add_argument('--model_artifact_path', type=str.strip, required=True, help='Identifies the S3 path where you want Amazon SageMaker to store the model artifacts.')
   parser.add_argument('--output_encryption_key', type=str.strip, required=False, help='The AWS KMS key that Amazon SageMaker uses to encrypt the model artifacts.', default='')
-  parser.add_argument('--vpc_security_group_ids', type=str.strip, required=False, help='The VPC security group IDs, in the form sg-xxxxxxxx.')
-  parser.add_argument('--vpc_subnets', type=str.strip, required=False, help='The ID of the subnets in the VPC to which you want to connect your hpo job.')
+  parser.add_argument('--vpc_security_group_ids', type=str.strip, required=False, help='A comma-separated list of VPC security group IDs, in the form sg-xxxxxxxx.')
+  parser.add_argument('--vpc_subnets', type=str.strip, required=False, help='A comma-separated list of IDs of the subnets in the VPC to which you want to connect your training job.')
   parser.add_argument('--network_isolation', type=_utils.str_to_bool, required=False, help='Isolates the training container.', default=True)
   parser.add_argument('--traffic_encryption', type=_utils.str_to_bool, required=False, help='Encrypts all communications between ML compute instances in distributed training.', default=False)
 
@@ -58,13 +58,7 @@ def main(argv=None):
   logging.getLogger().setLevel(logging.INFO)
   client = _utils.get_sagemaker_client(args.region, args.endpoint_url)
 
-  logging.info('Submitting Training Job to SageMaker...')
-  job_name = _utils.create_training_job(client, vars(args))
-  logging.info('Job request submitted. Waiting for completion...')
-  _utils.wait_for_training_job(client, job_name)
-
-  image = _utils.get_image_from_job(client, job_name)
-  model_artifact_url = _utils.get_model_artifacts_from_job(client, job_name)
+  job_name, model_artifact_url, image = _utils.run_training_job(client, vars(args))
   logging.info('Get model artifacts %s from training job %s.', model_artifact_url, job_name)
 
   with open('/tmp/model_artifact_url.txt', 'w') as f: